@@ -1,70 +1,386 @@
-import boto3
-import json
 import logging
-from typing import Dict, List, Tuple
+import orjson
+import queue
+import random
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
 import pandas as pd
-from config import AWS_REGION, BEDROCK_MODEL_ID
+from llm_cache import LLMCache
+from semantic_cache import SemanticCache
+from config import AWS_REGION, BEDROCK_MODEL_ID, BEDROCK_LATENCY_MODE, MAX_PARALLEL_REQUESTS, PARALLEL_ROW_THRESHOLD
 
 logger = logging.getLogger(__name__)
 
+_JSON_BLOCK_PATTERNS = [
+    re.compile(pattern, re.DOTALL | re.IGNORECASE)
+    for pattern in (
+        r'```json\s*\n(.*?)\n```',
+        r'```\s*\n({.*?})\s*\n```',
+        r'```({.*?})```'
+    )
+]
+
+_FALLBACK_RULES = [
+    (re.compile(r'name|title', re.IGNORECASE), "Sample Name"),
+    (re.compile(r'age|count|number', re.IGNORECASE), 25),
+    (re.compile(r'city|location', re.IGNORECASE), "Sample City"),
+    (re.compile(r'salary|price|cost', re.IGNORECASE), 50000)
+]
+
+def _json_default(value):
+    """Serialize values orjson doesn't support natively, mapping pandas missing values to null"""
+    if value is pd.NA or value is pd.NaT:
+        return None
+    return str(value)
+
+class _RowStreamParser:
+    """Incrementally extract complete objects from the "rows" array of a streamed JSON response"""
+
+    def __init__(self):
+        self._buffer = ""
+        self._pos = 0
+        self._in_rows = False
+        self._done = False
+        self._depth = 0
+        self._start = None
+        self._in_string = False
+        self._escaped = False
+    
+    def feed(self, text: str) -> List[Dict]:
+        """Consume a text delta and return any rows completed by it"""
+        rows = []
+        if self._done:
+            return rows
+        
+        self._buffer += text
+        if not self._in_rows:
+            key_idx = self._buffer.find('"rows"')
+            array_idx = self._buffer.find('[', key_idx) if key_idx != -1 else -1
+            if array_idx == -1:
+                return rows
+            self._in_rows = True
+            self._buffer = self._buffer[array_idx + 1:]
+            self._pos = 0
+        
+        buf = self._buffer
+        for i in range(self._pos, len(buf)):
+            char = buf[i]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == '\\':
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char == '{':
+                if self._depth == 0:
+                    self._start = i
+                self._depth += 1
+            elif char == '}' and self._depth:
+                self._depth -= 1
+                if self._depth == 0:
+                    try:
+                        rows.append(orjson.loads(buf[self._start:i + 1]))
+                    except orjson.JSONDecodeError:
+                        pass
+                    self._start = None
+            elif char == ']' and self._depth == 0:
+                self._done = True
+                break
+        
+        # Keep only the row currently being received
+        keep = self._start if self._start is not None else len(buf)
+        self._buffer = buf[keep:]
+        self._pos = len(buf) - keep
+        if self._start is not None:
+            self._start = 0
+        return rows
+
 class BedrockService:
     def __init__(self, region_name: str = AWS_REGION):
-        """Initialize Bedrock client"""
-        try:
-            self.bedrock_runtime = boto3.client(
-                service_name='bedrock-runtime',
-                region_name=region_name
-            )
-            self.model_id = BEDROCK_MODEL_ID
-        except Exception as e:
-            logger.error(f"Failed to initialize Bedrock client: {e}")
-            self.bedrock_runtime = None
+        """Initialize Bedrock service; the client is created on first use"""
+        self.region_name = region_name
+        self.model_id = BEDROCK_MODEL_ID
+        self.latency_mode = BEDROCK_LATENCY_MODE
+        self.cache = LLMCache()
+        self.semantic_cache = SemanticCache()
+        self._bedrock_runtime = None
+        self._client_failed = False
+    
+    @property
+    def client_status(self) -> Optional[bool]:
+        """True once the client exists, False if creating it failed, None if not attempted yet"""
+        if self._client_failed:
+            return False
+        return True if self._bedrock_runtime is not None else None
     
-    def generate_csv_rows(self, df: pd.DataFrame, num_rows: int = 5) -> Tuple[List[Dict], str]:
+    @property
+    def bedrock_runtime(self):
+        """Bedrock runtime client, or None if it could not be created"""
+        if self._bedrock_runtime is None and not self._client_failed:
+            try:
+                # Imported here to keep boto3 out of app start-up
+                import boto3
+                from botocore.config import Config
+                
+                client_config = Config(
+                    region_name=self.region_name,
+                    max_pool_connections=64,
+                    retries={'max_attempts': 3, 'mode': 'adaptive'},
+                    tcp_keepalive=True,
+                    connect_timeout=3,
+                    read_timeout=60
+                )
+                self._bedrock_runtime = boto3.client(
+                    service_name='bedrock-runtime',
+                    region_name=self.region_name,
+                    config=client_config
+                )
+            except Exception as e:
+                logger.error(f"Failed to initialize Bedrock client: {e}")
+                self._client_failed = True
+        return self._bedrock_runtime
+    
+    def generate_csv_rows(self, df: pd.DataFrame, num_rows: int = 5, use_cache: bool = True,
+                          cache_scope: Optional[str] = None) -> Tuple[List[Dict], str]:
         """
         Generate new CSV rows based on existing data schema and sample
         
         Args:
             df: Pandas DataFrame with existing data
             num_rows: Number of new rows to generate
+            use_cache: Whether to return previously generated rows when available
+            cache_scope: Session/dataset scope for the semantic cache; it is skipped when None
             
         Returns:
             Tuple of (generated_rows, explanation)
         """
+        generated_rows, explanation = [], ""
+        for generated_rows, explanation in self.stream_csv_rows(df, num_rows, use_cache, cache_scope):
+            pass
+        return generated_rows, explanation
+    
+    def stream_csv_rows(self, df: pd.DataFrame, num_rows: int = 5, use_cache: bool = True,
+                        cache_scope: Optional[str] = None) -> Iterator[Tuple[List[Dict], Optional[str]]]:
+        """
+        Generate new CSV rows, yielding each row as soon as it has been received
+        
+        Args:
+            df: Pandas DataFrame with existing data
+            num_rows: Number of new rows to generate
+            use_cache: Whether to return previously generated rows when available
+            cache_scope: Session/dataset scope for the semantic cache; it is skipped when None
+            
+        Yields:
+            (rows_so_far, None) while streaming, then a final (generated_rows, explanation)
+        """
         if not self.bedrock_runtime:
-            return [], "Bedrock client not available"
+            yield [], "Bedrock client not available"
+            return
         
         try:
             # Prepare prompt with schema and sample data
-            prompt = self._create_prompt(df, num_rows)
+            summary = self._summarize_data(df)
+            prompt = self._format_prompt(*summary, num_rows)
+            
+            # Reuse a previous response for an identical request
+            cache_key = LLMCache.make_key(self.model_id, prompt, num_rows)
+            cached = self.cache.get(cache_key) if use_cache else None
+            if cached is not None:
+                yield cached
+                return
             
-            # Call Bedrock API
-            response = self._call_bedrock_api(prompt)
+            # Fall back to rows generated for a near-identical schema in the same scope
+            columns = df.columns.tolist()
+            schema_key = self._describe_schema(df)
+            if use_cache and cache_scope is not None:
+                similar = self.semantic_cache.get(cache_scope, schema_key, num_rows)
+                if similar is not None:
+                    rows, explanation = similar
+                    yield [{col: row.get(col, "Unknown") for col in columns} for row in rows], explanation
+                    return
             
-            # Parse response
-            generated_rows, explanation = self._parse_response(response, df.columns.tolist())
+            # Split large requests into concurrent batches, surfacing rows as they complete
+            batch_sizes = self._split_batches(num_rows)
+            if len(batch_sizes) == 1:
+                prompts = [prompt]
+            else:
+                prompts = [
+                    self._format_prompt(*summary, batch_size, seed=random.randrange(1 << 30))
+                    for batch_size in batch_sizes
+                ]
+            
+            events = queue.Queue()
+            cancel = threading.Event()
+            responses = [None] * len(prompts)
+            batch_rows = [[] for _ in prompts]
+            errors = [None] * len(prompts)
+            streamed_rows = []
+            executor = ThreadPoolExecutor(max_workers=len(prompts))
+            try:
+                for i, (batch_prompt, batch_size) in enumerate(zip(prompts, batch_sizes)):
+                    max_tokens = self._max_tokens(batch_size, len(columns))
+                    executor.submit(self._stream_batch, i, batch_prompt, max_tokens, events, cancel)
+                
+                pending = len(prompts)
+                while pending:
+                    kind, i, payload = events.get()
+                    if kind == "rows":
+                        rows = [{col: row.get(col, "Unknown") for col in columns} for row in payload]
+                        batch_rows[i].extend(rows)
+                        if len(streamed_rows) < num_rows:
+                            streamed_rows.extend(rows)
+                            del streamed_rows[num_rows:]
+                            yield list(streamed_rows), None
+                    elif kind == "done":
+                        responses[i] = payload
+                        pending -= 1
+                    else:
+                        # Keep draining the healthy batches; this one's streamed rows are kept
+                        errors[i] = payload
+                        pending -= 1
+            finally:
+                cancel.set()
+                executor.shutdown(wait=False, cancel_futures=True)
             
-            return generated_rows, explanation
+            failures = [e for e in errors if e is not None]
+            if len(failures) == len(prompts) and not any(batch_rows):
+                raise failures[0]
+            
+            # Parse the full responses for the explanation and validated rows
+            generated_rows, explanation = [], ""
+            all_parsed = not failures
+            truncated_batches = 0
+            for i, result in enumerate(responses):
+                if result is None:
+                    # Batch was interrupted; keep the rows it streamed before the failure
+                    generated_rows.extend(batch_rows[i])
+                    continue
+                response, stop_reason = result
+                truncated = stop_reason == "max_tokens"
+                truncated_batches += truncated
+                rows, batch_explanation, parsed = self._parse_response(response, columns)
+                parsed = parsed and not truncated
+                if batch_rows[i] and (not parsed or len(rows) < len(batch_rows[i])):
+                    # The full response didn't parse cleanly; keep the rows already streamed from it
+                    if not parsed:
+                        batch_explanation = ""
+                    rows, parsed = batch_rows[i], False
+                generated_rows.extend(rows)
+                explanation = explanation or batch_explanation
+                all_parsed = all_parsed and parsed
+            generated_rows = generated_rows[:num_rows]
+            if generated_rows and not explanation:
+                explanation = "AI generated new rows based on existing patterns"
+            if truncated_batches:
+                explanation += (
+                    f"\n\n⚠️ {truncated_batches} of {len(prompts)} responses hit the output token limit; "
+                    f"kept the rows that were complete."
+                )
+            
+            if failures:
+                logger.error(f"Error generating rows: {failures[0]}")
+                explanation = (explanation + "\n\n" if explanation else "") + (
+                    f"⚠️ {len(failures)} of {len(prompts)} generation requests did not finish ({failures[0]}); "
+                    f"showing the {len(generated_rows)} rows that completed."
+                )
+            
+            # Never cache placeholder rows from a failed or truncated response
+            if generated_rows and all_parsed:
+                self.cache.set(cache_key, (generated_rows, explanation))
+                if cache_scope is not None:
+                    self.semantic_cache.add(cache_scope, schema_key, num_rows, generated_rows, explanation)
+            
+            yield generated_rows, explanation
             
         except Exception as e:
             logger.error(f"Error generating rows: {e}")
-            return [], f"Error generating rows: {str(e)}"
+            yield [], f"Error generating rows: {str(e)}"
     
-    def _create_prompt(self, df: pd.DataFrame, num_rows: int) -> str:
-        """Create prompt for the LLM"""
+    def _split_batches(self, num_rows: int) -> List[int]:
+        """Split num_rows into evenly sized batches for parallel requests"""
+        if num_rows <= PARALLEL_ROW_THRESHOLD:
+            return [num_rows]
+        k = min(MAX_PARALLEL_REQUESTS, num_rows)
+        return [num_rows // k + (1 if i < num_rows % k else 0) for i in range(k)]
+    
+    def _max_tokens(self, num_rows: int, num_columns: int) -> int:
+        """Size the output token budget to the requested rows instead of always reserving the cap"""
+        # ~150 tokens per pretty-printed row (more for wide schemas) plus room for the explanation
+        tokens_per_row = max(150, 25 * num_columns)
+        return min(4000, 400 + tokens_per_row * num_rows)
+    
+    def _stream_batch(self, index: int, prompt: str, max_tokens: int, events: queue.Queue,
+                      cancel: threading.Event) -> None:
+        """Stream one batch in a worker thread, reporting rows and the full response and stop reason on events"""
+        try:
+            parser = _RowStreamParser()
+            chunks = []
+            stop_reason = None
+            stream = self._open_bedrock_stream(prompt, max_tokens)
+            try:
+                for event in stream:
+                    if cancel.is_set():
+                        return
+                    if 'messageStop' in event:
+                        stop_reason = event['messageStop'].get('stopReason')
+                    if 'contentBlockDelta' not in event:
+                        continue
+                    delta = event['contentBlockDelta']['delta'].get('text', '')
+                    chunks.append(delta)
+                    new_rows = [row for row in parser.feed(delta) if isinstance(row, dict)]
+                    if new_rows:
+                        events.put(("rows", index, new_rows))
+            finally:
+                # Release the connection, including when the batch is cancelled
+                stream.close()
+            events.put(("done", index, ("".join(chunks), stop_reason)))
+        except Exception as e:
+            events.put(("error", index, e))
+    
+    def _describe_schema(self, df: pd.DataFrame) -> str:
+        """Describe column names and types only, used as the semantic cache key"""
+        return "\n".join(f"- {col} ({df[col].dtype})" for col in df.columns)
+    
+    def _summarize_data(self, df: pd.DataFrame) -> Tuple[str, str]:
+        """Describe the schema and sample rows of df for the prompt"""
+        head = df.head(5)
+        
         # Get basic statistics
         schema_info = []
         for col in df.columns:
             dtype = str(df[col].dtype)
             unique_count = df[col].nunique()
-            sample_values = df[col].dropna().head(5).tolist()
+            # Reuse the head slice unless it has nulls that hide further examples
+            sample_values = head[col].dropna().tolist()
+            if len(sample_values) < len(head) and len(df) > len(head):
+                sample_values = df[col].dropna().head(5).tolist()
             
             schema_info.append(f"- {col} ({dtype}): {unique_count} unique values, examples: {sample_values}")
         
         schema_text = "\n".join(schema_info)
         
         # Get sample rows
-        sample_rows = df.head(5).to_dict('records')
+        columns = df.columns.tolist()
+        sample_rows = [dict(zip(columns, row)) for row in head.itertuples(index=False, name=None)]
+        
+        sample_text = orjson.dumps(
+            sample_rows,
+            default=_json_default,
+            option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+        ).decode()
+        
+        return schema_text, sample_text
+    
+    def _format_prompt(self, schema_text: str, sample_text: str, num_rows: int, seed: Optional[int] = None) -> str:
+        """Create prompt for the LLM"""
+        variation = ""
+        if seed is not None:
+            variation = f"\n5. Differ from rows generated in other parallel batches (variation seed: {seed})"
         
         prompt = f"""You are a data analyst helping to expand a dataset. Given the following CSV schema and sample data, generate {num_rows} new realistic rows that follow the same patterns and distributions.
 
@@ -72,13 +388,13 @@ DATASET SCHEMA:
 {schema_text}
 
 SAMPLE DATA (first 5 rows):
-{json.dumps(sample_rows, indent=2, default=str)}
+{sample_text}
 
 TASK: Generate exactly {num_rows} new rows that:
 1. Follow the same data types and patterns
 2. Have realistic values that fit the distribution
 3. Maintain logical relationships between columns
-4. Add diversity while staying consistent with the dataset
+4. Add diversity while staying consistent with the dataset{variation}
 
 RESPONSE FORMAT:
 Please respond with a JSON object containing:
@@ -100,54 +416,68 @@ Generate the response now:"""
 
         return prompt
     
-    def _call_bedrock_api(self, prompt: str) -> str:
-        """Call Bedrock API with the prompt"""
-        body = {
-            "anthropic_version": "bedrock-2023-05-31",
-            "max_tokens": 4000,
-            "temperature": 0.7,
+    def _open_bedrock_stream(self, prompt: str, max_tokens: int = 4000):
+        """Call Bedrock ConverseStream API with the prompt and return its event stream"""
+        request = {
+            "modelId": self.model_id,
             "messages": [
                 {
-                    "role": "user", 
-                    "content": prompt
+                    "role": "user",
+                    "content": [{"text": prompt}]
                 }
-            ]
+            ],
+            "inferenceConfig": {
+                "maxTokens": max_tokens,
+                "temperature": 0.7,
+                "stopSequences": ["\n\nGenerate"]
+            }
         }
         
-        response = self.bedrock_runtime.invoke_model(
-            modelId=self.model_id,
-            body=json.dumps(body)
-        )
+        response = None
+        if self.latency_mode == "optimized":
+            try:
+                response = self.bedrock_runtime.converse_stream(
+                    performanceConfig={"latency": "optimized"},
+                    **request
+                )
+            except self.bedrock_runtime.exceptions.ValidationException as e:
+                # Not every model/region supports latency-optimized inference
+                logger.warning(f"Latency-optimized inference unavailable for {self.model_id}, using standard: {e}")
+                self.latency_mode = "standard"
         
-        response_body = json.loads(response['body'].read())
-        return response_body['content'][0]['text']
+        if response is None:
+            response = self.bedrock_runtime.converse_stream(**request)
+        
+        return response['stream']
 
-    def _parse_response(self, response: str, columns: List[str]) -> Tuple[List[Dict], str]:
-        """Parse the LLM response to extract rows and explanation"""
+    def _parse_response(self, response: str, columns: List[str]) -> Tuple[List[Dict], str, bool]:
+        """Parse the LLM response to extract rows, explanation and whether parsing succeeded"""
         try:
-            parsed = self._try_parse_json(response, columns)
-            if parsed is not None:
-                return parsed
-
-            parsed = self._try_parse_json_blocks(response, columns)
-            if parsed is not None:
-                return parsed
-
-            parsed = self._try_parse_json_object(response, columns)
-            if parsed is not None:
-                return parsed
+            # Pick parsing strategies from the response shape to avoid failed full parses
+            text = response.strip()
+            if text.startswith('{') and text.endswith('}'):
+                attempts = (self._try_parse_json, self._try_parse_json_object)
+            elif '```' in text:
+                attempts = (self._try_parse_json_blocks, self._try_parse_json_object)
+            else:
+                attempts = (self._try_parse_json_object,)
+            
+            for attempt in attempts:
+                parsed = attempt(text, columns)
+                if parsed is not None:
+                    return (*parsed, True)
 
-            return self._create_fallback_response(response, columns)
+            return (*self._create_fallback_response(response, columns), False)
         except Exception as e:
             logger.error(f"Error parsing response: {e}")
-            return [], f"Error parsing AI response: {str(e)}"
+            return [], f"Error parsing AI response: {str(e)}", False
 
     def _try_parse_json(self, response: str, columns: List[str]):
         """Try to parse the entire response as JSON"""
         try:
-            parsed = json.loads(response.strip())
+            parsed = orjson.loads(response)
             return self._extract_data_from_json(parsed, columns)
-        except json.JSONDecodeError:
+        except orjson.JSONDecodeError:
             return None
 
     def _try_parse_json_blocks(self, response: str, columns: List[str]):
@@ -155,9 +485,9 @@ Generate the response now:"""
         json_blocks = self._extract_json_blocks(response)
         for json_block in json_blocks:
             try:
-                parsed = json.loads(json_block)
+                parsed = orjson.loads(json_block)
                 return self._extract_data_from_json(parsed, columns)
-            except json.JSONDecodeError:
+            except orjson.JSONDecodeError:
                 continue
         return None
 
@@ -166,49 +496,61 @@ Generate the response now:"""
         json_obj = self._find_json_object(response)
         if json_obj:
             try:
-                parsed = json.loads(json_obj)
+                parsed = orjson.loads(json_obj)
                 return self._extract_data_from_json(parsed, columns)
-            except json.JSONDecodeError:
+            except orjson.JSONDecodeError:
                 return None
         return None
     
     def _extract_json_blocks(self, text: str) -> List[str]:
         """Extract JSON from code blocks"""
-        import re
-        patterns = [
-            r'```json\s*\n(.*?)\n```',
-            r'```\s*\n({.*?})\s*\n```',
-            r'```({.*?})```'
-        ]
-        
         json_blocks = []
-        for pattern in patterns:
-            matches = re.findall(pattern, text, re.DOTALL | re.IGNORECASE)
-            json_blocks.extend(matches)
+        for pattern in _JSON_BLOCK_PATTERNS:
+            json_blocks.extend(pattern.findall(text))
         
         return json_blocks
     
     def _find_json_object(self, text: str) -> str:
         """Find the first valid JSON object in text"""
-        stack = []
-        start_idx = None
-        for i, char in enumerate(text):
-            if char == '{':
-                if start_idx is None:
-                    start_idx = i
-                stack.append('{')
-            elif char == '}' and stack:
-                stack.pop()
-                if not stack and start_idx is not None:
-                    candidate = text[start_idx:i + 1]
-                    try:
-                        json.loads(candidate)
-                        return candidate
-                    except json.JSONDecodeError:
-                        start_idx = None
-                        stack = []
+        start_idx = text.find('{')
+        while start_idx != -1:
+            end_idx = self._match_brace(text, start_idx)
+            if end_idx != -1:
+                candidate = text[start_idx:end_idx + 1]
+                try:
+                    orjson.loads(candidate)
+                    return candidate
+                except orjson.JSONDecodeError:
+                    pass
+            # Unbalanced or not JSON; an object may still start inside this span
+            start_idx = text.find('{', start_idx + 1)
         return ""
     
+    @staticmethod
+    def _match_brace(text: str, start_idx: int) -> int:
+        """Return the index of the brace closing text[start_idx], skipping braces inside strings, or -1"""
+        depth = 0
+        in_string = False
+        escaped = False
+        for i in range(start_idx, len(text)):
+            char = text[i]
+            if in_string:
+                if escaped:
+                    escaped = False
+                elif char == '\\':
+                    escaped = True
+                elif char == '"':
+                    in_string = False
+            elif char == '"':
+                in_string = True
+            elif char == '{':
+                depth += 1
+            elif char == '}':
+                depth -= 1
+                if depth == 0:
+                    return i
+        return -1
+    
     def _extract_data_from_json(self, parsed: dict, columns: List[str]) -> Tuple[List[Dict], str]:
         """Extract rows and explanation from parsed JSON"""
         rows = parsed.get('rows', [])
@@ -236,17 +578,7 @@ Generate the response now:"""
         # Create one default row
         fallback_row = {}
         for col in columns:
-            col_lower = col.lower()
-            if any(word in col_lower for word in ['name', 'title']):
-                fallback_row[col] = "Sample Name"
-            elif any(word in col_lower for word in ['age', 'count', 'number']):
-                fallback_row[col] = 25
-            elif any(word in col_lower for word in ['city', 'location']):
-                fallback_row[col] = "Sample City"
-            elif any(word in col_lower for word in ['salary', 'price', 'cost']):
-                fallback_row[col] = 50000
-            else:
-                fallback_row[col] = "Sample Value"
+            fallback_row[col] = next((value for pattern, value in _FALLBACK_RULES if pattern.search(str(col))), "Sample Value")
         
         return [fallback_row], explanation
 
@@ -1,13 +1,30 @@
 # AWS Configuration
 # Set these environment variables or modify directly
 AWS_REGION = "us-east-1"  # Change to your preferred region
-BEDROCK_MODEL_ID = "anthropic.claude-3-sonnet-20240229-v1:0"  # Claude 3 Sonnet
+BEDROCK_MODEL_ID = "us.anthropic.claude-3-sonnet-20240229-v1:0"  # Claude 3 Sonnet (cross-region inference profile)
+BEDROCK_LATENCY_MODE = "optimized"  # "optimized" or "standard"; falls back to standard where unsupported
+# Optimized latency takes effect with e.g. AWS_REGION = "us-east-2" and the Claude 3.5 Haiku profile below
 
 # Alternative models you can use:
+# "us.anthropic.claude-3-5-haiku-20241022-v1:0"  # Claude 3.5 Haiku (supports latency-optimized inference)
 # "anthropic.claude-3-haiku-20240307-v1:0"  # Claude 3 Haiku (faster, cheaper)
 # "mistral.mistral-7b-instruct-v0:2"  # Mistral 7B
 # "mistral.mixtral-8x7b-instruct-v0:1"  # Mixtral 8x7B
 
+# Parallel Generation Configuration
+PARALLEL_ROW_THRESHOLD = 4  # Requests for more rows than this are split into concurrent batches
+MAX_PARALLEL_REQUESTS = 4
+
+# Response Cache Configuration
+CACHE_MAX_ENTRIES = 128  # In-memory LRU size
+CACHE_DIR = "~/.cache/genai-csv"  # On-disk cache (used when diskcache is installed); None to disable
+
+# Semantic Cache Configuration (used when sentence-transformers and faiss are installed)
+SEMANTIC_CACHE_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+SEMANTIC_CACHE_THRESHOLD = 0.92  # Minimum cosine similarity for a cache hit
+SEMANTIC_CACHE_MAX_ENTRIES = 32  # Per scope (one scope per browser session)
+SEMANTIC_CACHE_MAX_SCOPES = 64
+
 # Streamlit Configuration
 MAX_FILE_SIZE_MB = 200
 SAMPLE_ROWS_DISPLAY = 5
@@ -1,91 +1,142 @@
 import pandas as pd
 import numpy as np
-from typing import Dict, List, Tuple
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
 import io
 
-def analyze_dataframe(df: pd.DataFrame) -> Dict:
+CATEGORICAL_DTYPES = ['object', 'string', 'string[pyarrow]']
+
+@dataclass
+class DFView:
+    """DataFrame with its numeric and categorical column lists computed once"""
+    df: pd.DataFrame
+    numeric_cols: List[str]
+    categorical_cols: List[str]
+    
+    @classmethod
+    def from_dataframe(cls, df: pd.DataFrame) -> "DFView":
+        return cls(
+            df,
+            df.select_dtypes(include='number').columns.tolist(),
+            df.select_dtypes(include=CATEGORICAL_DTYPES).columns.tolist()
+        )
+
+def read_csv_upload(file) -> pd.DataFrame:
+    """Read a CSV with the pyarrow engine, keeping date/time columns as their original text"""
+    df = pd.read_csv(file, engine='pyarrow', dtype_backend='pyarrow')
+    
+    # pyarrow infers ISO dates/timestamps; re-read just those columns as text, as the C engine keeps them
+    temporal_cols = [
+        col for col, dtype in df.dtypes.items()
+        if isinstance(dtype, pd.ArrowDtype) and pa.types.is_temporal(dtype.pyarrow_dtype)
+    ]
+    if temporal_cols:
+        file.seek(0)
+        convert_options = pa_csv.ConvertOptions(
+            include_columns=temporal_cols,
+            column_types={col: pa.string() for col in temporal_cols}
+        )
+        text_df = pa_csv.read_csv(file, convert_options=convert_options).to_pandas(types_mapper=pd.ArrowDtype)
+        df[temporal_cols] = text_df[temporal_cols]
+    return df
+
+def analyze_dataframe(df: pd.DataFrame, numeric_cols: Optional[List[str]] = None,
+                      categorical_cols: Optional[List[str]] = None) -> Dict:
     """Analyze DataFrame and return comprehensive statistics"""
+    missing = df.isnull().sum()
     analysis = {
         'shape': df.shape,
         'columns': df.columns.tolist(),
         'dtypes': dict(df.dtypes.astype(str)),
-        'missing_values': df.isnull().sum().to_dict(),
+        'missing_values': missing.to_dict(),
         'numeric_stats': {},
         'categorical_stats': {}
     }
     
-    # Analyze numeric columns
-    numeric_cols = df.select_dtypes(include=[np.number]).columns
-    for col in numeric_cols:
-        analysis['numeric_stats'][col] = {
-            'mean': float(df[col].mean()) if not df[col].isna().all() else None,
-            'std': float(df[col].std()) if not df[col].isna().all() else None,
-            'min': float(df[col].min()) if not df[col].isna().all() else None,
-            'max': float(df[col].max()) if not df[col].isna().all() else None,
-            'unique_count': int(df[col].nunique())
-        }
+    # Analyze numeric columns in one aggregation pass
+    if numeric_cols is None:
+        numeric_cols = df.select_dtypes(include='number').columns
+    if len(numeric_cols):
+        stats = df[numeric_cols].agg(['mean', 'std', 'min', 'max', 'nunique'])
+        all_missing = missing[numeric_cols] == len(df)
+        for col in numeric_cols:
+            empty = all_missing[col]
+            analysis['numeric_stats'][col] = {
+                'mean': None if empty else float(stats.at['mean', col]),
+                'std': None if empty else float(stats.at['std', col]),
+                'min': None if empty else float(stats.at['min', col]),
+                'max': None if empty else float(stats.at['max', col]),
+                'unique_count': int(stats.at['nunique', col])
+            }
     
-    # Analyze categorical columns
-    categorical_cols = df.select_dtypes(include=['object', 'string']).columns
-    for col in categorical_cols:
-        value_counts = df[col].value_counts().head(10)
-        analysis['categorical_stats'][col] = {
-            'unique_count': int(df[col].nunique()),
-            'most_common': value_counts.to_dict(),
-            'sample_values': df[col].dropna().head(5).tolist()
-        }
+    # Analyze categorical columns; value counts are computed on demand via top_values
+    if categorical_cols is None:
+        categorical_cols = df.select_dtypes(include=CATEGORICAL_DTYPES).columns
+    if len(categorical_cols):
+        unique_counts = df[categorical_cols].nunique()
+        for col in categorical_cols:
+            analysis['categorical_stats'][col] = {
+                'unique_count': int(unique_counts[col]),
+                'sample_values': df[col].dropna().head(5).tolist()
+            }
     
     return analysis
 
+def top_values(df: pd.DataFrame, col: str, n: int = 10) -> pd.Series:
+    """Return the n most common values of a column"""
+    return df[col].value_counts().head(n)
+
 def append_rows_to_dataframe(original_df: pd.DataFrame, new_rows: List[Dict]) -> pd.DataFrame:
     """Append new rows to DataFrame"""
     if not new_rows:
         return original_df
     
-    # Create DataFrame from new rows
-    new_df = pd.DataFrame(new_rows)
-    
-    # Ensure column order matches
-    new_df = new_df.reindex(columns=original_df.columns)
-    
-    # Append and return
-    result_df = pd.concat([original_df, new_df], ignore_index=True)
-    return result_df
+    # Align to the original columns so pandas resolves each column's dtype
+    new_df = pd.DataFrame(new_rows).reindex(columns=original_df.columns)
+    return pd.concat([original_df, new_df], ignore_index=True)
 
-def create_download_link(df: pd.DataFrame, filename: str = "enhanced_data.csv") -> Tuple[str, str]:
-    """Create downloadable CSV data"""
-    csv_buffer = io.StringIO()
-    df.to_csv(csv_buffer, index=False)
-    csv_data = csv_buffer.getvalue()
-    return csv_data, filename
+def create_download_link(df: pd.DataFrame, filename: str = "enhanced_data.csv",
+                         chunksize: int = 10_000) -> Tuple[io.BytesIO, str]:
+    """Create downloadable CSV data, encoded in chunks straight into a bytes buffer"""
+    csv_buffer = io.BytesIO()
+    df.to_csv(csv_buffer, index=False, chunksize=chunksize, encoding='utf-8')
+    csv_buffer.seek(0)
+    return csv_buffer, filename
 
-def detect_potential_biases(original_df: pd.DataFrame, comparison_df: pd.DataFrame) -> List[str]:
+def detect_potential_biases(original_df: pd.DataFrame, comparison_df: pd.DataFrame,
+                            numeric_cols: Optional[List[str]] = None,
+                            categorical_cols: Optional[List[str]] = None) -> List[str]:
     """Detect potential biases between original and new data"""
     biases = []
     
     # Check for categorical column distributions
-    categorical_cols = original_df.select_dtypes(include=['object', 'string']).columns
+    if categorical_cols is None:
+        categorical_cols = original_df.select_dtypes(include=CATEGORICAL_DTYPES).columns
     
     for col in categorical_cols:
         if col in comparison_df.columns:
-            orig_values = set(original_df[col].dropna().unique())
-            new_values = set(comparison_df[col].dropna().unique())
-            
-            # Check for new categories
-            novel_values = new_values - orig_values
-            if novel_values:
-                biases.append(f"New categories in '{col}': {list(novel_values)}")
+            # Hash-based set difference on the unique values
+            novel_values = pd.Index(comparison_df[col].dropna().unique()).difference(original_df[col].dropna().unique())
+            if len(novel_values):
+                biases.append(f"New categories in '{col}': {novel_values.tolist()}")
     
-    # Check numeric distributions
-    numeric_cols = original_df.select_dtypes(include=[np.number]).columns
+    # Check numeric distributions, comparing all column means at once
+    if numeric_cols is None:
+        numeric_cols = original_df.select_dtypes(include='number').columns
+    numeric_cols = [
+        col for col in numeric_cols
+        if col in comparison_df.columns and not comparison_df[col].isna().all()
+    ]
     
-    for col in numeric_cols:
-        if col in comparison_df.columns and not comparison_df[col].isna().all():
-            orig_mean = original_df[col].mean()
-            new_mean = comparison_df[col].mean()
-            
-            if abs(orig_mean - new_mean) > orig_mean * 0.2:  # 20% difference
-                biases.append(f"Significant mean shift in '{col}': {orig_mean:.2f} → {new_mean:.2f}")
+    if numeric_cols:
+        orig_means = original_df[numeric_cols].mean().to_numpy(dtype=float, na_value=np.nan)
+        new_means = comparison_df[numeric_cols].mean().to_numpy(dtype=float, na_value=np.nan)
+        shifted = np.abs(orig_means - new_means) > 0.2 * np.abs(orig_means)  # 20% difference
+        
+        for i in np.flatnonzero(shifted):
+            biases.append(f"Significant mean shift in '{numeric_cols[i]}': {orig_means[i]:.2f} → {new_means[i]:.2f}")
     
     return biases
 
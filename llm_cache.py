@@ -0,0 +1,75 @@
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Optional
+
+import orjson
+
+from config import CACHE_DIR, CACHE_MAX_ENTRIES
+
+try:
+    import diskcache
+except ImportError:  # optional dependency
+    diskcache = None
+
+logger = logging.getLogger(__name__)
+
+class LLMCache:
+    """Exact-match cache for LLM responses with an optional on-disk tier"""
+
+    def __init__(self, maxsize: int = CACHE_MAX_ENTRIES, cache_dir: Optional[str] = CACHE_DIR):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+        # Streamlit serves sessions from threads sharing this instance
+        self._lock = threading.Lock()
+        self._disk = None
+        
+        if diskcache is not None and cache_dir:
+            try:
+                self._disk = diskcache.Cache(os.path.expanduser(cache_dir))
+            except Exception as e:
+                logger.warning(f"Disk cache unavailable, using memory only: {e}")
+    
+    @staticmethod
+    def make_key(model_id: str, prompt: str, num_rows: int) -> str:
+        """Build a deterministic cache key for a generation request"""
+        payload = orjson.dumps({"model": model_id, "prompt": prompt, "n": num_rows}, option=orjson.OPT_SORT_KEYS)
+        return hashlib.sha256(payload).hexdigest()
+    
+    def get(self, key: str) -> Optional[Any]:
+        """Return the cached value for key, or None on a miss"""
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return self._memory[key]
+        
+        value = self._disk.get(key) if self._disk is not None else None
+        with self._lock:
+            if value is not None:
+                self._remember(key, value)
+                self.hits += 1
+                return value
+            self.misses += 1
+            return None
+    
+    def set(self, key: str, value: Any) -> None:
+        """Store value under key in memory and on disk"""
+        with self._lock:
+            self._remember(key, value)
+        if self._disk is not None:
+            try:
+                self._disk.set(key, value)
+            except Exception as e:
+                logger.warning(f"Failed to write disk cache entry: {e}")
+    
+    def _remember(self, key: str, value: Any) -> None:
+        # Callers hold self._lock
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        if len(self._memory) > self.maxsize:
+            self._memory.popitem(last=False)
@@ -1,13 +1,13 @@
 import streamlit as st
 import pandas as pd
-import plotly.express as px
-import plotly.graph_objects as go
-from typing import Dict, List
-import json
+import uuid
 
 from bedrock_service import bedrock_service
 from data_utils import (
+    DFView,
     analyze_dataframe, 
+    read_csv_upload,
+    top_values,
     append_rows_to_dataframe, 
     create_download_link,
     detect_potential_biases,
@@ -30,8 +30,11 @@ st.markdown("*Enhance your datasets with AI-generated rows using Amazon Bedrock*
 with st.sidebar:
     st.header("⚙️ Configuration")
     
-    # AWS Configuration check
-    if bedrock_service.bedrock_runtime is None:
+    # AWS Configuration check; reading the status doesn't create the client
+    client_status = bedrock_service.client_status
+    if client_status is None:
+        st.info("☁️ AWS Bedrock connects on first generation")
+    elif not client_status:
         st.error("⚠️ AWS Bedrock not configured!")
         st.markdown("""
         **Setup Instructions:**
@@ -48,6 +51,13 @@ with st.sidebar:
     
     show_bias_analysis = st.checkbox("Show bias analysis", value=True)
     show_charts = st.checkbox("Show distribution charts", value=True)
+    reuse_cached_rows = st.checkbox(
+        "Reuse cached results", value=True,
+        help="Return previously generated rows for an identical request instead of calling Bedrock again"
+    )
+    
+    # Response cache statistics, filled in once this run's generations are done
+    cache_stats = st.empty()
 
 # Initialize session state
 if 'original_df' not in st.session_state:
@@ -58,6 +68,23 @@ if 'generation_explanation' not in st.session_state:
     st.session_state.generation_explanation = ""
 if 'enhanced_df' not in st.session_state:
     st.session_state.enhanced_df = None
+if 'cache_scope' not in st.session_state:
+    # Keeps semantic cache hits within this browser session
+    st.session_state.cache_scope = uuid.uuid4().hex
+
+def stream_generated_rows(source_df: pd.DataFrame, num_rows: int, use_cache: bool = True):
+    """Render generated rows as they stream in and store the final result"""
+    preview = st.empty()
+    stream = bedrock_service.stream_csv_rows(
+        source_df, num_rows, use_cache=use_cache, cache_scope=st.session_state.cache_scope
+    )
+    for rows, explanation in stream:
+        st.session_state.generated_rows = rows
+        if explanation is None:
+            preview.dataframe(pd.DataFrame(rows), use_container_width=True)
+        else:
+            st.session_state.generation_explanation = explanation
+    preview.empty()
 
 # 1. CSV Upload Section
 st.header("📂 Upload CSV Dataset")
@@ -69,8 +96,15 @@ uploaded_file = st.file_uploader(
 
 if uploaded_file:
     try:
-        # Load the CSV
-        df = pd.read_csv(uploaded_file)
+        # Load the CSV once per upload; reruns reuse the parsed frame and its column lists
+        # file_id changes on every upload, even for a re-uploaded file with the same name and size
+        upload_key = uploaded_file.file_id
+        if st.session_state.get('view_key') != upload_key:
+            df = read_csv_upload(uploaded_file)
+            st.session_state.view = DFView.from_dataframe(df)
+            st.session_state.view_key = upload_key
+        view = st.session_state.view
+        df = view.df
         st.session_state.original_df = df
         
         # 2. Schema & Sample Viewer
@@ -80,7 +114,7 @@ if uploaded_file:
         
         with col1:
             st.subheader("📋 Schema Information")
-            analysis = analyze_dataframe(df)
+            analysis = analyze_dataframe(df, view.numeric_cols, view.categorical_cols)
             
             st.metric("Total Rows", analysis['shape'][0])
             st.metric("Total Columns", analysis['shape'][1])
@@ -104,11 +138,13 @@ if uploaded_file:
         
         # Distribution charts
         if show_charts and len(df.columns) > 0:
+            import plotly.express as px
+            
             st.subheader("📈 Data Distributions")
             
             # Select columns for visualization
-            numeric_cols = df.select_dtypes(include=['number']).columns.tolist()
-            categorical_cols = df.select_dtypes(include=['object', 'string']).columns.tolist()
+            numeric_cols = view.numeric_cols
+            categorical_cols = view.categorical_cols
             
             if numeric_cols:
                 chart_col = st.selectbox("Select column for distribution chart", 
@@ -118,7 +154,7 @@ if uploaded_file:
                     fig = px.histogram(df, x=chart_col, title=f"Distribution of {chart_col}")
                     st.plotly_chart(fig, use_container_width=True)
                 elif chart_col in categorical_cols:
-                    value_counts = df[chart_col].value_counts().head(10)
+                    value_counts = top_values(df, chart_col)
                     fig = px.bar(x=value_counts.index, y=value_counts.values, 
                                title=f"Top values in {chart_col}")
                     fig.update_xaxis(title=chart_col)
@@ -131,29 +167,10 @@ if uploaded_file:
         col1, col2, col3 = st.columns([1, 1, 1])
         
         with col1:
-            if st.button("🎯 Generate New Rows", type="primary", use_container_width=True):
-                with st.spinner("🔮 AI is analyzing your data and generating new rows..."):
-                    generated_rows, explanation = bedrock_service.generate_csv_rows(
-                        df, num_rows_to_generate
-                    )
-                    
-                    st.session_state.generated_rows = generated_rows
-                    st.session_state.generation_explanation = explanation
+            generate_clicked = st.button("🎯 Generate New Rows", type="primary", use_container_width=True)
         
         with col2:
-            if st.button("🔄 Regenerate with New Sample", use_container_width=True):
-                if len(df) > SAMPLE_ROWS_DISPLAY:
-                    # Use a different sample
-                    shuffled_df = shuffle_dataframe_sample(df, SAMPLE_ROWS_DISPLAY * 2)
-                    with st.spinner("🔮 Generating with new data sample..."):
-                        generated_rows, explanation = bedrock_service.generate_csv_rows(
-                            shuffled_df, num_rows_to_generate
-                        )
-                        
-                        st.session_state.generated_rows = generated_rows
-                        st.session_state.generation_explanation = explanation
-                else:
-                    st.warning("Dataset too small for regeneration with new sample")
+            regenerate_clicked = st.button("🔄 Regenerate with New Sample", use_container_width=True)
         
         with col3:
             if st.button("🗑️ Clear Generated Rows", use_container_width=True):
@@ -161,6 +178,19 @@ if uploaded_file:
                 st.session_state.generation_explanation = ""
                 st.session_state.enhanced_df = None
         
+        if generate_clicked:
+            with st.spinner("🔮 AI is analyzing your data and generating new rows..."):
+                stream_generated_rows(df, num_rows_to_generate, use_cache=reuse_cached_rows)
+        
+        if regenerate_clicked:
+            if len(df) > SAMPLE_ROWS_DISPLAY:
+                # Use a different sample
+                shuffled_df = shuffle_dataframe_sample(df, SAMPLE_ROWS_DISPLAY * 2)
+                with st.spinner("🔮 Generating with new data sample..."):
+                    stream_generated_rows(shuffled_df, num_rows_to_generate, use_cache=False)
+            else:
+                st.warning("Dataset too small for regeneration with new sample")
+        
         # 4. Display Generated Rows
         if st.session_state.generated_rows:
             st.header("✨ Generated Rows")
@@ -185,7 +215,7 @@ if uploaded_file:
             
             # Bias analysis
             if show_bias_analysis:
-                biases = detect_potential_biases(df, edited_df)
+                biases = detect_potential_biases(df, edited_df, view.numeric_cols, view.categorical_cols)
                 if biases:
                     st.warning("⚠️ **Potential Bias Considerations:**")
                     for bias in biases:
@@ -235,9 +265,11 @@ if uploaded_file:
                 
                 # Comparison charts
                 if show_charts and len(df.columns) > 0:
+                    import plotly.express as px
+                    
                     st.subheader("📊 Before vs After Comparison")
                     
-                    numeric_cols = df.select_dtypes(include=['number']).columns.tolist()
+                    numeric_cols = view.numeric_cols
                     if numeric_cols:
                         comparison_col = st.selectbox(
                             "Select column for before/after comparison",
@@ -281,6 +313,11 @@ else:
     - **Flexible Generation**: Regenerate with different samples
     """)
 
+# The cache is shared by every session in this server process
+cache_stats.caption(
+    f"🗄️ Response cache (all sessions): {bedrock_service.cache.hits} hits / {bedrock_service.cache.misses} misses"
+)
+
 # Footer
 st.markdown("---")
 st.markdown("*Built with Streamlit, AWS Bedrock, and ❤️*")
\ No newline at end of file
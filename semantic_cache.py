@@ -0,0 +1,102 @@
+import importlib.util
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from config import (
+    SEMANTIC_CACHE_MAX_ENTRIES,
+    SEMANTIC_CACHE_MAX_SCOPES,
+    SEMANTIC_CACHE_MODEL,
+    SEMANTIC_CACHE_THRESHOLD
+)
+
+logger = logging.getLogger(__name__)
+
+class SemanticCache:
+    """Similarity cache mapping schema descriptions to previously generated rows, partitioned by scope"""
+
+    def __init__(self, model_name: str = SEMANTIC_CACHE_MODEL, threshold: float = SEMANTIC_CACHE_THRESHOLD,
+                 max_entries: int = SEMANTIC_CACHE_MAX_ENTRIES, max_scopes: int = SEMANTIC_CACHE_MAX_SCOPES):
+        self.model_name = model_name
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.max_scopes = max_scopes
+        # Optional dependencies; only imported once the cache is first used
+        self.enabled = all(importlib.util.find_spec(name) is not None for name in ('faiss', 'sentence_transformers'))
+        self._model = None
+        # scope -> (faiss index, [(embedding, num_rows, rows, explanation)])
+        self._scopes = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def _embed(self, text: str) -> np.ndarray:
+        """Embed text with an L2-normalized sentence embedding"""
+        if self._model is None:
+            # Loaded on first use so the app starts without paying for the model
+            from sentence_transformers import SentenceTransformer
+            
+            self._model = SentenceTransformer(self.model_name)
+        return self._model.encode(text, normalize_embeddings=True).astype('float32')
+    
+    def _scope(self, scope: str, create: bool):
+        """Return the (index, entries) pair for scope, evicting the least recently used scope"""
+        if scope in self._scopes:
+            self._scopes.move_to_end(scope)
+            return self._scopes[scope]
+        if not create:
+            return None
+        
+        import faiss
+        
+        self._scopes[scope] = (faiss.IndexFlatIP(self._model.get_sentence_embedding_dimension()), [])
+        if len(self._scopes) > self.max_scopes:
+            self._scopes.popitem(last=False)
+        return self._scopes[scope]
+    
+    def get(self, scope: str, schema_text: str, num_rows: int) -> Optional[Tuple[List[Dict], str]]:
+        """Return cached (rows, explanation) for a similar schema within scope, or None"""
+        if not self.enabled:
+            return None
+        
+        try:
+            with self._lock:
+                cached = self._scope(scope, create=False)
+                if cached is None:
+                    return None
+                index, entries = cached
+                
+                emb = self._embed(schema_text)
+                scores, ids = index.search(emb[None, :], 1)
+                if scores[0, 0] <= self.threshold:
+                    return None
+                
+                _, cached_rows, rows, explanation = entries[ids[0, 0]]
+                if cached_rows != num_rows:
+                    return None
+                return rows, explanation
+        except Exception as e:
+            logger.warning(f"Semantic cache lookup failed: {e}")
+            return None
+    
+    def add(self, scope: str, schema_text: str, num_rows: int, rows: List[Dict], explanation: str) -> None:
+        """Store generated rows within scope under the embedding of schema_text"""
+        if not self.enabled:
+            return
+        
+        try:
+            with self._lock:
+                emb = self._embed(schema_text)
+                index, entries = self._scope(scope, create=True)
+                entries.append((emb, num_rows, rows, explanation))
+                
+                if len(entries) > self.max_entries:
+                    # IndexFlatIP ids are positional, so rebuild it without the oldest entry
+                    del entries[0]
+                    index.reset()
+                    index.add(np.stack([entry[0] for entry in entries]))
+                else:
+                    index.add(emb[None, :])
+        except Exception as e:
+            logger.warning(f"Semantic cache insert failed: {e}")
@@ -0,0 +1,234 @@
+import importlib.machinery
+import importlib.util
+import json
+import re
+import sys
+import threading
+import types
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+
+from bedrock_service import BedrockService, _RowStreamParser
+from llm_cache import LLMCache
+from semantic_cache import SemanticCache
+
+class StubStream(list):
+    def close(self):
+        pass
+
+class FailingStream(StubStream):
+    def __iter__(self):
+        raise RuntimeError("ThrottlingException: rate exceeded")
+
+class StubClient:
+    """Bedrock runtime stand-in that answers with the requested number of rows"""
+    exceptions = SimpleNamespace(ValidationException=type("ValidationException", (Exception,), {}))
+    
+    def __init__(self, fail_calls=(), truncate=False):
+        self.fail_calls = set(fail_calls)
+        self.truncate = truncate
+        self.calls = 0
+        self._lock = threading.Lock()
+    
+    def converse_stream(self, **request):
+        with self._lock:
+            self.calls += 1
+            call = self.calls
+        if call in self.fail_calls:
+            return {'stream': FailingStream()}
+        
+        prompt = request['messages'][0]['content'][0]['text']
+        num_rows = int(re.search(r'generate (\d+) new', prompt).group(1))
+        rows = [{"name": f"row{call}-{i}", "age": i} for i in range(num_rows)]
+        text = "```json\n" + json.dumps({"rows": rows, "explanation": "ok"}) + "\n```"
+        stop_reason = "end_turn"
+        if self.truncate:
+            # Cut the body off partway through the last row, as the token limit would
+            text = text[:text.rindex('{"name"') + 12]
+            stop_reason = "max_tokens"
+        events = [{'contentBlockDelta': {'delta': {'text': text[i:i + 16]}}} for i in range(0, len(text), 16)]
+        events.append({'messageStop': {'stopReason': stop_reason}})
+        return {'stream': StubStream(events)}
+
+def make_service(client):
+    service = BedrockService()
+    service._bedrock_runtime = client
+    service.cache = LLMCache(cache_dir=None)
+    service.latency_mode = "standard"
+    return service
+
+def test_failed_batch_keeps_rows_from_healthy_batches():
+    df = pd.DataFrame({'name': ['a', 'b'], 'age': [1, 2]})
+    client = StubClient(fail_calls={1})
+    rows, explanation = make_service(client).generate_csv_rows(df, 12)
+    
+    assert client.calls == 4
+    assert len(rows) == 9
+    assert "1 of 4 generation requests did not finish" in explanation
+
+def test_all_batches_failing_reports_error():
+    df = pd.DataFrame({'name': ['a'], 'age': [1]})
+    client = StubClient(fail_calls={1, 2, 3, 4})
+    rows, explanation = make_service(client).generate_csv_rows(df, 8)
+    
+    assert rows == []
+    assert explanation.startswith("Error generating rows:")
+
+def test_truncated_response_keeps_streamed_rows():
+    df = pd.DataFrame({'name': ['a'], 'age': [1]})
+    service = make_service(StubClient(truncate=True))
+    rows, explanation = service.generate_csv_rows(df, 4)
+    
+    assert [row['name'] for row in rows] == ['row1-0', 'row1-1', 'row1-2']
+    assert "Sample Value" not in str(rows)
+    assert "1 of 1 responses hit the output token limit" in explanation
+    assert len(service.cache._memory) == 0
+
+def test_complete_response_is_cached():
+    df = pd.DataFrame({'name': ['a'], 'age': [1]})
+    service = make_service(StubClient())
+    rows, explanation = service.generate_csv_rows(df, 3)
+    
+    assert len(rows) == 3
+    assert "token limit" not in explanation
+    assert len(service.cache._memory) == 1
+
+class NoOptimizedLatencyClient(StubClient):
+    def converse_stream(self, **request):
+        if 'performanceConfig' in request:
+            raise self.exceptions.ValidationException("latency optimized inference is not supported")
+        return super().converse_stream(**request)
+
+def test_optimized_latency_falls_back_to_standard():
+    df = pd.DataFrame({'name': ['a'], 'age': [1]})
+    service = make_service(NoOptimizedLatencyClient())
+    service.latency_mode = "optimized"
+    rows, _ = service.generate_csv_rows(df, 2)
+    
+    assert len(rows) == 2
+    assert service.latency_mode == "standard"
+
+def test_row_parser_handles_chunked_feeds():
+    text = 'Sure!\n```json\n{"explanation": "x", "rows": [{"a": 1}, {"a": {"b": [2]}}], "bias_flags": [{"c": 3}]}\n```'
+    parser = _RowStreamParser()
+    rows = []
+    for char in text:
+        rows.extend(parser.feed(char))
+    assert rows == [{"a": 1}, {"a": {"b": [2]}}]
+
+def test_row_parser_ignores_braces_inside_strings():
+    parser = _RowStreamParser()
+    rows = parser.feed('{"rows": [{"a": "}{", "b": "say \\"}\\" ok"}, {"a": "]"}]}')
+    assert rows == [{"a": "}{", "b": 'say "}" ok'}, {"a": "]"}]
+
+def test_row_parser_skips_incomplete_trailing_row():
+    parser = _RowStreamParser()
+    assert parser.feed('{"rows": [{"a": 1}, {"a": 2}, {"a": "tru') == [{"a": 1}, {"a": 2}]
+    assert parser.feed('ncated"') == []
+
+def test_find_json_object():
+    service = make_service(StubClient())
+    assert service._find_json_object('Here: {"a": "}{", "b": {"c": 1}} trailing }') == '{"a": "}{", "b": {"c": 1}}'
+    assert service._find_json_object('{bad} then {"ok": 1}') == '{"ok": 1}'
+    assert service._find_json_object('{not json "abc} then {"rows": []}') == '{"rows": []}'
+    assert service._find_json_object('{"rows": [{"a": 1},') == '{"a": 1}'
+    assert service._find_json_object("no json here") == ""
+
+def test_split_batches():
+    service = make_service(StubClient())
+    assert service._split_batches(4) == [4]
+    assert service._split_batches(5) == [2, 1, 1, 1]
+    assert service._split_batches(12) == [3, 3, 3, 3]
+
+def test_llm_cache_lru_and_counters():
+    cache = LLMCache(maxsize=2, cache_dir=None)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    
+    assert cache.get("b") is None
+    assert cache.get("c") == 3
+    assert (cache.hits, cache.misses) == (2, 1)
+
+def test_llm_cache_is_thread_safe():
+    cache = LLMCache(maxsize=8, cache_dir=None)
+    
+    def worker(offset):
+        for i in range(2000):
+            key = str((i + offset) % 16)
+            cache.set(key, i)
+            cache.get(key)
+    
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    
+    assert len(cache._memory) == 8
+    assert cache.hits + cache.misses == 8 * 2000
+
+def test_llm_cache_key_is_deterministic():
+    assert LLMCache.make_key("m", "p", 5) == LLMCache.make_key("m", "p", 5)
+    assert LLMCache.make_key("m", "p", 5) != LLMCache.make_key("m", "p", 6)
+
+class _StubIndex:
+    def __init__(self, dim):
+        self.vectors = np.zeros((0, dim), dtype='float32')
+    
+    def add(self, vectors):
+        self.vectors = np.vstack([self.vectors, vectors])
+    
+    def reset(self):
+        self.vectors = self.vectors[:0]
+    
+    def search(self, query, k):
+        scores = self.vectors @ query[0]
+        best = int(np.argmax(scores))
+        return np.array([[scores[best]]]), np.array([[best]])
+
+class _StubModel:
+    def __init__(self, name):
+        pass
+    
+    def get_sentence_embedding_dimension(self):
+        return 2
+    
+    def encode(self, text, normalize_embeddings):
+        vector = np.array([len(text), 1.0])
+        return vector / np.linalg.norm(vector)
+
+def _stub_module(monkeypatch, name, **attrs):
+    module = types.ModuleType(name)
+    module.__spec__ = importlib.machinery.ModuleSpec(name, None)
+    module.__dict__.update(attrs)
+    monkeypatch.setitem(sys.modules, name, module)
+
+def test_semantic_cache_is_scoped_and_bounded(monkeypatch):
+    _stub_module(monkeypatch, 'faiss', IndexFlatIP=_StubIndex)
+    _stub_module(monkeypatch, 'sentence_transformers', SentenceTransformer=_StubModel)
+    cache = SemanticCache(max_entries=2, max_scopes=2)
+    assert cache.enabled
+    
+    cache.add("s1", "- a (int64)", 5, [{"a": 1}], "first")
+    assert cache.get("s1", "- a (int64)", 5) == ([{"a": 1}], "first")
+    assert cache.get("s2", "- a (int64)", 5) is None
+    assert cache.get("s1", "- a (int64)", 4) is None
+    
+    cache.add("s1", "- bb (int64)", 5, [{"b": 1}], "second")
+    cache.add("s1", "- ccc (int64)", 5, [{"c": 1}], "third")
+    index, entries = cache._scopes["s1"]
+    assert len(entries) == 2 and len(index.vectors) == 2
+    
+    cache.add("s2", "- a (int64)", 5, [], "")
+    cache.add("s3", "- a (int64)", 5, [], "")
+    assert list(cache._scopes) == ["s2", "s3"]
+
+def test_semantic_cache_disabled_without_dependencies(monkeypatch):
+    monkeypatch.setattr(importlib.util, 'find_spec', lambda name: None)
+    cache = SemanticCache()
+    assert not cache.enabled
+    assert cache.get("s1", "- a (int64)", 5) is None
@@ -0,0 +1,57 @@
+import io
+
+import pandas as pd
+
+from data_utils import DFView, append_rows_to_dataframe, detect_potential_biases, read_csv_upload
+
+def test_append_rows_keeps_int_dtype():
+    df = pd.DataFrame({'a': [1, 2], 'b': [3, 4]})
+    result = append_rows_to_dataframe(df, [{'a': 5, 'b': 6}])
+    assert result['a'].tolist() == [1, 2, 5]
+    assert result.dtypes.tolist() == df.dtypes.tolist()
+
+def test_append_rows_does_not_truncate_floats_into_int_columns():
+    df = pd.DataFrame({'a': [1, 2], 'b': [3, 4]})
+    result = append_rows_to_dataframe(df, [{'a': 1.5, 'b': 2}])
+    assert result['a'].tolist() == [1.0, 2.0, 1.5]
+    assert result['a'].dtype == 'float64'
+
+def test_append_rows_with_none_keeps_int_formatting():
+    df = pd.DataFrame({'a': [28, 30], 'b': [3, 4]})
+    result = append_rows_to_dataframe(df, [{'a': None, 'b': 2}])
+    assert result.to_csv(index=False).splitlines() == ['a,b', '28,3', '30,4', ',2']
+
+def test_append_rows_with_text_and_missing_columns():
+    df = pd.DataFrame({'name': ['x'], 'age': [1]})
+    result = append_rows_to_dataframe(df, [{'name': 'y', 'age': 'Unknown'}, {'name': 'z'}])
+    assert result['name'].tolist() == ['x', 'y', 'z']
+    assert result['age'].tolist()[:2] == [1, 'Unknown']
+    assert pd.isna(result['age'].iloc[2])
+
+def test_append_rows_with_list_values():
+    df = pd.DataFrame({'a': [1, 2], 'b': ['x', 'y']})
+    result = append_rows_to_dataframe(df, [{'a': [1, 2], 'b': 'z'}])
+    assert result['a'].tolist() == [1, 2, [1, 2]]
+    assert result['b'].tolist() == ['x', 'y', 'z']
+
+def test_append_rows_keeps_arrow_dtypes():
+    df = pd.DataFrame({'a': [1, 2]}, dtype='int64[pyarrow]')
+    result = append_rows_to_dataframe(df, [{'a': 3}])
+    assert isinstance(result['a'].dtype, pd.ArrowDtype)
+    assert result['a'].tolist() == [1, 2, 3]
+
+def test_append_rows_empty_returns_original():
+    df = pd.DataFrame({'a': [1]})
+    assert append_rows_to_dataframe(df, []) is df
+
+def test_read_csv_upload_keeps_dates_categorical():
+    csv = io.BytesIO(b"name,joined,n\na,2024-01-01T10:00:00,1\nb,2024-01-02,2\n")
+    df = read_csv_upload(csv)
+    view = DFView.from_dataframe(df)
+    assert df['joined'].tolist() == ['2024-01-01T10:00:00', '2024-01-02']
+    assert view.categorical_cols == ['name', 'joined']
+    assert view.numeric_cols == ['n']
+    
+    new_rows = pd.DataFrame([{'name': 'a', 'joined': '2024-01-05', 'n': 1}])
+    biases = detect_potential_biases(df, new_rows, view.numeric_cols, view.categorical_cols)
+    assert "New categories in 'joined': ['2024-01-05']" in biases